@@ -21,6 +21,84 @@ file1 = argv[1]
 file2 = argv[2]
 
 
+class UF:
+    '''
+    Union-find over mutant ids. Every id in a file is unioned with the other
+    members of its equivalence class, so `find` maps each mutant to a single
+    representative of its class.
+
+    The original program '0' appears in one class per name tuple, so it is
+    never unioned; doing so would merge every equivalent-mutant class into
+    one. Instead we remember which classes contain '0'.
+    '''
+
+    def __init__(self, equivs=()):
+        self.parent = {}
+        self.with_original = []  # Members of classes that contain '0'
+        for equiv_class in equivs:
+            members = [elem for elem in equiv_class if elem != '0']
+            if not members:
+                continue
+            for elem in members:
+                self.parent.setdefault(elem, elem)
+            for elem in members[1:]:
+                self.union(members[0], elem)
+            if len(members) != len(equiv_class):
+                self.with_original.append(members[0])
+
+    def __contains__(self, x):
+        return x in self.parent
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+    def classes(self):
+        '''
+        Return a dict mapping each representative to a frozenset of its class
+        members. Equal classes from two files then compare with one hash lookup.
+        '''
+        result = {}
+        for elem in self.parent:
+            result.setdefault(self.find(elem), []).append(elem)
+        for elem in self.with_original:
+            members = result[self.find(elem)]
+            if members[-1] != '0':
+                members.append('0')
+        return {root: frozenset(members) for root, members in result.items()}
+
+
+def compare(uf_a, uf_b, fmt):
+    '''
+    Print each equivalence class in `uf_a` that isn't contained in exactly one
+    equivalence class of `uf_b`.
+    '''
+    classes_b = uf_b.classes()
+    shared = set(classes_b.values())
+    for members in uf_a.classes().values():
+        # Identical classes are by far the common case
+        if members in shared:
+            continue
+        roots_b = {uf_b.find(m) for m in members if m in uf_b}
+        if len(roots_b) != 1:
+            print("    {}".format(' '.join(members)))
+        else:
+            (root_b,) = roots_b
+            if not members <= classes_b[root_b]:
+                print(fmt.format(' '.join(members), [set(classes_b[root_b])]))
+
+
 def main():
     with open(file1) as f:
         f1 = f.readlines()
@@ -29,76 +107,16 @@ def main():
     equivs1 = [x.strip().split() for x in f1 if x.strip()]
     equivs2 = [x.strip().split() for x in f2 if x.strip()]
 
-    mids = set()
-
-    # Map mutant ids to their containing equivalence classes
-    mid_map_1 = {}
-    mid_map_2 = {}
-    for equiv_class in equivs1:
-        mids.update(equiv_class)
-        for elem in equiv_class:
-            mid_map_1[elem] = set(equiv_class)
-    for equiv_class in equivs2:
-        mids.update(equiv_class)
-        for elem in equiv_class:
-            mid_map_2[elem] = set(equiv_class)
-
-    if '0' in mids:
-        mids.remove('0')
+    uf1 = UF(equivs1)
+    uf2 = UF(equivs2)
 
     # Visit file 1
     print("Inspecting file {}", file1)
-    visited = {'0'}
-    for mid in mid_map_1:
-        if mid in visited:
-            continue
-        ec1 = mid_map_1[mid]
-        visited.update(ec1)
-
-        # Find all equiv classes in the second file
-        nested_visited = set()
-        equiv_classes_2 = []
-        for m in ec1:
-            if m in nested_visited:
-                continue
-            if m not in mid_map_2:
-                continue
-            ec2 = mid_map_2[m]
-            equiv_classes_2.append(ec2)
-            nested_visited.update(ec2)
-
-        if len(equiv_classes_2) != 1:
-            print("    {}".format(' '.join(list(ec1))))
-        else:
-            if not ec1.issubset(equiv_classes_2[0]):
-                print("    {:40} : {}".format(' '.join(list(ec1)), equiv_classes_2))
+    compare(uf1, uf2, "    {:40} : {}")
 
     # Visit file 2
     print("Inspecting file", file2)
-    visited = {'0'}
-    for mid in mid_map_2:
-        if mid in visited:
-            continue
-        ec2 = mid_map_2[mid]
-        visited.update(ec2)
-
-        # Find all equiv classes in the second file
-        nested_visited = set()
-        equiv_classes_1 = []
-        for m in ec2:
-            if m in nested_visited:
-                continue
-            if m not in mid_map_1:
-                continue
-            ec2 = mid_map_1[m]
-            equiv_classes_1.append(ec2)
-            nested_visited.update(ec2)
-
-        if len(equiv_classes_1) != 1:
-            print("    {}".format(' '.join(list(ec2))))
-        else:
-            if not ec2.issubset(equiv_classes_1[0]):
-                print("    {} : {}".format(' '.join(list(ec2)), equiv_classes_1))
+    compare(uf2, uf1, "    {} : {}")
 
 if __name__ == '__main__':
     main()
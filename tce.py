@@ -28,81 +28,410 @@ instead of O(N^2) performance.
 
 1. For each mutant we want to:
 
-   a. Create `hashes` dictionary, which maps tuple `(path1, path2, path3, ...)`
-      to a dict `Dict[str, Set[str]]`. This nested dict maps classfile contents
-      to a set of mutant ids
+   a. Create `tuple_cache` dictionary, which maps each distinct tuple `(path1,
+      path2, path3, ...)` to a small integer id `name_id`
 
-      Create `equivalences` list, which is a list of all non-singleton
-      equivalence classes. An equivalence class is a `Set[str]`, such as the
-      ones in the domain of the Dict above; it is just a set of mutant ids
+      Create `size_buckets` list, which maps each `name_id` to a dictionary
+      from `size_tuple` (see below) to a list of mutants
+
+      Create a table of rows `(mid_id, name_id, contents_digest)`, where
+      `mid_id` indexes into the list of mutant ids. The table is stored
+      column-wise as flat arrays of 64-bit integers (with `contents_digest`
+      split into two words) rather than as nested dicts and sets, so it is
+      compact and can be sorted without touching Python objects
 
    b. Find the names, relative to the package root (so `org.blah...`), of all
-      compiled classfiles corresponding to that mutant
+      compiled classfiles corresponding to that mutant, along with their sizes
 
    c. Sort the names and store in a tuple `name_tuple`: this will give a
       _canonical ordering_ to the classfiles, and this canonical ordering allows
-      us to use the tuple as a key into a dictionary
-
-   d. Using `name_tuple` as a key, add an empty dict as a default entry to
-      `hashes` and obtain the result; if this is ambiguous, the line
+      us to use the tuple as a key into a dictionary. Store the corresponding
+      file sizes in `size_tuple`
+
+   d. Look up the `name_id` of `name_tuple` in `tuple_cache`, assigning the
+      next free id if this is a new name tuple
+
+   e. Add the mutant to `size_buckets[name_id][size_tuple]`
+
+2. Two classfiles of different sizes can't be equal, so a mutant that is alone
+   in its size bucket can only be equivalent to the original program, and only
+   if the original's classfiles have the same sizes. For each bucket:
+
+   a. Look up the sizes of the original classfiles named by `name_tuple`. If
+      the bucket holds a single mutant and the sizes differ, that mutant is in a
+      class by itself and we never open its classfiles
+
+   b. Otherwise, for each mutant in the bucket hash each classfile named in the
+      tuple, then hash the concatenation of those digests into a single digest
+      `contents_digest`. This is a small, fixed-size key, so we never keep
+      whole classfiles in memory. 128 bits leave plenty of room against
+      collisions even for billions of mutants
+
+   c. Add the row `(mid_id, name_id, contents_digest)` to the table
+
+3. Once every mutant of a name tuple has been hashed we need to add in
+   equivalent mutants. For each such `name_tuple`:
+
+   a. If some bucket for `name_tuple` matched the original's sizes, map
+      `name_tuple` to the digest of the original classfiles read from the
+      original project, storing this value as `contents_digest`
+
+   b. Store `contents_digest` at index `name_id` of the original's digest
+      columns and mark `orig_hashed[name_id]`. Name ids are handed out densely
+      from 0, so these columns can be indexed directly by `name_id`. Name
+      tuples we didn't hash stay unmarked and never match any row
+
+4. Rows with equal `(name_id, contents_digest)` form an equivalence class.
+   When numpy is installed we `lexsort` the table so that each class is a
+   contiguous run of rows and split it at the run boundaries; otherwise we
+   group rows with a dict. A class contains the original program '0' when its
+   digest equals the original's digest for its `name_id`; with numpy this is a
+   single vectorized gather and compare over all classes. Classes with more
+   than one member (counting '0') are the non-singleton equivalence classes,
+   and those containing '0' are the equivalent mutants. Grouping is not JIT
+   compiled: after the sort, the only per-row work left in Python is slicing
+   the runs, so a compiled aggregation loop would have nothing to speed up.
+
+Steps 2b through 4 run as a pipeline. Mutants are hashed in `name_id` order,
+and an equivalence class never spans two name tuples, so once the table holds
+at least `FLUSH_ROWS` rows and the current name tuple is complete we group the
+table, append its classes to the output files and empty it. Hashing jobs are
+generated lazily from `size_buckets`, which is released one name tuple at a
+time, and at most `POOL_WINDOW` tasks are in flight, so the workers can never
+run far ahead of the table. What remains proportional to the number of mutants
+is the list of mutant ids and the size buckets from step 1.
+
+The output files are written under a `.part` suffix and only renamed into place
+once the run succeeds, so a failed run leaves the previous results untouched.
 
-      ```
-      d = hashes.setdefault(name_tuple, {})
-      ```
-
-      has precisely the semantics we want
+'''
 
-   e. Map the tuple of names to the tuple of file contents; store as a tuple
-      `contents_tuple`
+from sys import argv, exit, intern, stdout
+from argparse import ArgumentParser
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice
+from operator import itemgetter
+import mmap
+import os
+import struct
 
-   f. Using `contents_tuple` as a key, add an empty set as a default entry to
-      the nested dict we obtained in step 3 (named `d` in the example). Obtain
-      the result as `eq_class`.
+from hashlib import blake2b
 
-   g. Add the current mutant id to `eq_class`. If `eq_class` has size of exactly
-      2, add it to `equivalences` (size == 2 means that this is a non-singleton
-      equivalence class; size > 2 means that we have already added it).
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
-2. After we've finished doing this for all mutants, we need to add in equivalent
-   mutants. For each key `name_tuple` in `hashes`:
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
 
-   a. Map `name_tuple` to the tuple of original classfiles read from the
-      original project, storing this value as `contents_tuple`
+try:
+    import liburing
+except ImportError:
+    liburing = None
 
-   b. Set a default value `hashes[name_tuple].setdefault(contents_tuple,
-      set()).add('0')`,
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-'''
+VALIDATE=False  # Should we validate the equivalences?
+DIGEST_SIZE = 16          # Bytes of digest kept per file and per mutant
+MMAP_THRESHOLD = 1 << 20  # Without xxhash, files this large use BLAKE3's multithreaded update_mmap
+URING_MIN_BATCH = 4       # Only batch reads through io_uring for at least this many files
+URING_DEPTH = 64          # Maximum number of io_uring reads in flight
+FLUSH_ROWS = 1 << 16      # Group and write out the table once it has this many rows
+POOL_CHUNKSIZE = 32       # Jobs per task submitted to the process pool
+POOL_WINDOW = 64          # Maximum number of tasks in flight in the process pool
+
+_ring = None  # Lazily created io_uring instance, one per process; False if unusable
+_layout_cache = {}  # Maps directory layouts to (name_tuple, order), one per process
+
+def new_hasher():
+    '''
+    Return a fresh hasher. Equivalence isn't a security boundary, so we prefer
+    the non-cryptographic XXH3-128 when it is installed, then BLAKE3, then
+    `hashlib.blake2b`. Only the first `DIGEST_SIZE` bytes of a digest are used.
+    '''
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    if blake3 is not None:
+        return blake3()
+    return blake2b(digest_size=DIGEST_SIZE)
+
+def hash_buffer(buf):
+    h = new_hasher()
+    h.update(buf)
+    return h.digest()[:DIGEST_SIZE]
+
+def hash_file(path):
+    '''
+    Return the `DIGEST_SIZE`-byte digest of the file at `path`.
 
-from sys import argv, exit
-from argparse import ArgumentParser
-import os
+    The file is memory-mapped rather than read so that we don't copy it into a
+    fresh buffer; repeated reads of the same path are served from the page
+    cache.
+    '''
+    with open(path, mode='rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if xxhash is None and blake3 is not None and size >= MMAP_THRESHOLD:
+            return blake3(max_threads=blake3.AUTO).update_mmap(path).digest()[:DIGEST_SIZE]
+        h = new_hasher()
+        if size:  # mmap refuses to map empty files
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        return h.digest()[:DIGEST_SIZE]
+
+def get_ring():
+    '''
+    Return this process's io_uring instance, or `None` if io_uring can't be
+    used here. The kernel or a seccomp profile may refuse to set up a ring even
+    when `liburing` imports, in which case we remember that and read files
+    the ordinary way.
+    '''
+    global _ring
+    if _ring is None:
+        ring = liburing.Ring()
+        try:
+            liburing.io_uring_queue_init(URING_DEPTH, ring)
+        except OSError:
+            _ring = False
+        else:
+            _ring = ring
+    return _ring or None
+
+def read_files_uring(paths):
+    '''
+    Read each file in `paths` into a `bytearray`, submitting the reads to
+    io_uring in batches of at most `URING_DEPTH`. Classfiles are small, so
+    issuing one `read` syscall per file costs more than the disk work itself;
+    batching amortizes that over the whole mutant.
+    '''
+    ring = get_ring()
+    if ring is None:
+        raise OSError('io_uring is not available')
+    cqe = liburing.Cqe()
+    bufs = [None] * len(paths)
+    for start in range(0, len(paths), URING_DEPTH):
+        batch = range(start, min(start + URING_DEPTH, len(paths)))
+        fds = {}
+        try:
+            # Open everything before touching the ring so a failed open can't
+            # leave half-prepared entries behind
+            for i in batch:
+                fds[i] = os.open(paths[i], os.O_RDONLY)
+                bufs[i] = bytearray(os.fstat(fds[i]).st_size)
+            for i in batch:
+                sqe = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_read(sqe, fds[i], bufs[i], 0)
+                liburing.io_uring_sqe_set_data64(sqe, i)
+            liburing.io_uring_submit_and_wait(ring, len(batch))
+            short_reads = []
+            errors = []
+            for _ in batch:
+                liburing.io_uring_wait_cqe(ring, cqe)
+                entry = cqe[0]
+                i, res = entry.user_data, entry.res
+                liburing.io_uring_cqe_seen(ring, entry)
+                if res < 0:
+                    errors.append(OSError(-res, os.strerror(-res), paths[i]))
+                elif res != len(bufs[i]):
+                    short_reads.append(i)
+            if errors:
+                raise errors[0]
+            for i in short_reads:
+                with open(paths[i], mode='rb') as f:
+                    bufs[i] = f.read()
+        finally:
+            for fd in fds.values():
+                os.close(fd)
+    return bufs
+
+def read_name_tuple_from_root(name_tuple, root, cache=None):
+    '''
+    Return a single digest over the classfiles in `name_tuple`, read relative
+    to `root`. Each file is hashed separately and the per-file digests are then
+    hashed together, so the result is a 16-byte key no matter how many
+    classfiles the mutant touches.
 
-VALIDATE=False  # Should we validate the equivalences?
+    If `cache` is given it maps names to per-file digests under `root`; names
+    found there aren't read again, and newly hashed files are added to it.
+    '''
+    if cache is None:
+        cache = {}
+    missing = [name for name in name_tuple if name not in cache]
+    if missing:
+        paths = [os.path.join(root, name) for name in missing]
+        if liburing is None or len(paths) < URING_MIN_BATCH or get_ring() is None:
+            digests = [hash_file(path) for path in paths]
+        else:
+            digests = [hash_buffer(buf) for buf in read_files_uring(paths)]
+        cache.update(zip(missing, digests))
+    return hash_buffer(b''.join(cache[name] for name in name_tuple))
+
+def walk_files(root):
+    '''
+    Yield `(relpath, entry)` for every file recursively contained in `root`,
+    where `relpath` is the containing directory relative to `root` and `entry`
+    is its `os.DirEntry`. Files are yielded grouped by their directory.
 
-def read_name_tuple_from_root(name_tuple, root):
-    contents = []
-    for name in name_tuple:
-        path = os.path.join(root, name)
-        with open(path, mode='rb') as f:
-            contents.append(f.read())
-    contents_tuple = tuple(contents)
-    return contents_tuple
+    This is a pared down `os.walk`: we only need file entries, and
+    `DirEntry.is_dir` answers from the directory listing itself without a
+    `stat` for anything that isn't a symlink.
+    '''
+    stack = [(root, os.curdir)]
+    while stack:
+        dirpath, relpath = stack.pop()
+        try:
+            it = os.scandir(dirpath)
+        except OSError:
+            continue  # os.walk silently skips unreadable directories too
+        with it:
+            for entry in it:
+                if entry.is_dir():
+                    # Like os.walk, don't descend into symlinked directories
+                    if not entry.is_symlink():
+                        child = entry.name if relpath == os.curdir else os.path.join(relpath, entry.name)
+                        stack.append((entry.path, child))
+                else:
+                    yield (relpath, entry)
+
+def scan_mutant(root):
+    '''
+    Return `(name_tuple, size_tuple)`: a sorted tuple of qualified path names
+    of all classfiles recursively contained in this directory, and a tuple of
+    their sizes in the same order.
+
+    Mutants share the same package layout, so most of them list exactly the
+    same directories and files. The layout, as `(relpath, filenames)` pairs in
+    walk order, is looked up in `_layout_cache`; only the first mutant with a
+    given layout joins, interns and sorts its names. Every later one reuses
+    that `name_tuple` and just reorders its sizes to match.
+    '''
+    # 1b
+    layout = []
+    sizes = []
+    for relpath, entries in groupby(walk_files(root), key=itemgetter(0)):
+        listing = sorted((entry.name, entry.stat().st_size) for (_, entry) in entries)
+        layout.append((relpath, tuple(filename for (filename, _) in listing)))
+        sizes += (size for (_, size) in listing)
+    layout = tuple(layout)
+
+    # 1c
+    cached = _layout_cache.get(layout)
+    if cached is None:
+        names = [intern(os.path.join(relpath, filename))
+                 for (relpath, filenames) in layout for filename in filenames]
+        order = sorted(range(len(names)), key=names.__getitem__)
+        cached = _layout_cache[layout] = (tuple(names[i] for i in order), order)
+    name_tuple, order = cached
+    return (name_tuple, tuple(sizes[i] for i in order))
 
 def get_name_tuple(root):
     '''
     Return a sorted tuple of qualified path names of all classfiles recursively
     contained in this directory.
     '''
-    name_list = []
-    for (dirpath, dirnames, filenames) in os.walk(root):
-        # 1b
-        if not filenames: continue
-        relpath = os.path.relpath(dirpath, root)
-        name_list += [os.path.join(relpath, filename) for filename in filenames]
+    return scan_mutant(root)[0]
 
+def orig_file_size(program, name, cache):
+    '''Return the size of classfile `name` in the original program, memoized in `cache`'''
+    size = cache.get(name)
+    if size is None:
+        size = cache[name] = os.stat(os.path.join(program, name)).st_size
+    return size
 
-    return tuple(sorted(name_list))
+def hash_mutant(root, name_tuple):
+    '''
+    Compute step 2b for a single mutant, returning its `contents_digest`. This
+    runs in a worker process, so it must not touch any shared state.
+    '''
+    return read_name_tuple_from_root(name_tuple, root)
+
+def split_digest(contents_digest):
+    '''Return a 128-bit digest as two signed 64-bit words'''
+    return struct.unpack_from('<qq', contents_digest)
+
+def group_rows(rows, originals, original_mid_id):
+    '''
+    Step 4: group the table `rows = (mid_ids, name_ids, digest_his,
+    digest_los)` by `(name_id, digest)`. `originals = (orig_hashed, orig_his,
+    orig_los)` holds the original program's digest for each name id for which
+    `orig_hashed` is set; groups matching it get `original_mid_id` appended as
+    their last member. Returns a list with
+    the `mid_id`s of each group that has more than one member.
+    '''
+    mid_ids, name_ids, digest_his, digest_los = rows
+    orig_hashed, orig_his, orig_los = originals
+    if np is None:
+        groups = {}
+        for row in zip(name_ids, digest_his, digest_los, mid_ids):
+            groups.setdefault(row[:3], []).append(row[3])
+        result = []
+        for (name_id, hi, lo), group in groups.items():
+            if orig_hashed[name_id] and orig_his[name_id] == hi and orig_los[name_id] == lo:
+                group.append(original_mid_id)
+            if len(group) > 1:
+                result.append(group)
+        return result
+
+    # array.array supports the buffer protocol, so these are zero-copy views
+    mid_ids, name_ids, digest_his, digest_los, orig_his, orig_los = (
+            np.frombuffer(column, dtype=np.int64)
+            for column in (mid_ids, name_ids, digest_his, digest_los, orig_his, orig_los))
+    orig_hashed = np.frombuffer(orig_hashed, dtype=bool)
+    if not len(mid_ids):
+        return []
+    order = np.lexsort((digest_los, digest_his, name_ids))
+    name_ids, digest_his, digest_los = name_ids[order], digest_his[order], digest_los[order]
+    boundary = np.empty(len(order), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = ((name_ids[1:] != name_ids[:-1])
+                    | (digest_his[1:] != digest_his[:-1])
+                    | (digest_los[1:] != digest_los[:-1]))
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(order))
+    group_name_ids = name_ids[starts]
+    equivalent = (orig_hashed[group_name_ids]
+                  & (orig_his[group_name_ids] == digest_his[starts])
+                  & (orig_los[group_name_ids] == digest_los[starts]))
+    keep = (ends - starts > 1) | equivalent
+    sorted_mid_ids = mid_ids[order]
+    result = []
+    for start, end, is_equivalent in zip(starts[keep], ends[keep], equivalent[keep]):
+        group = sorted_mid_ids[start:end].tolist()
+        if is_equivalent:
+            group.append(original_mid_id)
+        result.append(group)
+    return result
+
+def run_chunk(fn, chunk):
+    return [fn(*args) for args in chunk]
+
+def bounded_map(executor, fn, jobs):
+    '''
+    Like `executor.map`, but for an iterable of `(tag, args)` pairs, yielding
+    `(tag, fn(*args))` in order. Unlike `executor.map`, `jobs` is consumed
+    lazily and at most `POOL_WINDOW` tasks of `POOL_CHUNKSIZE` jobs are
+    submitted at once, so a slow consumer holds back the producer.
+    '''
+    jobs = iter(jobs)
+    in_flight = deque()
+    while True:
+        while len(in_flight) < POOL_WINDOW:
+            chunk = list(islice(jobs, POOL_CHUNKSIZE))
+            if not chunk:
+                break
+            tags = [tag for (tag, _) in chunk]
+            in_flight.append((tags, executor.submit(run_chunk, fn, [args for (_, args) in chunk])))
+        if not in_flight:
+            return
+        tags, future = in_flight.popleft()
+        yield from zip(tags, future.result())
 
 def run_tce(mutants, program):
     '''
@@ -116,92 +445,180 @@ def run_tce(mutants, program):
     '''
 
     # 1a
-    hashes = {}
-    nonsingleton_equivalence_classes = []
-    mids = next(os.walk(mutants))[1]
+    tuple_cache = {}
+    size_buckets = []  # Indexed by name_id
+    row_mid_ids = array('q')
+    row_name_ids = array('q')
+    row_digest_his = array('q')
+    row_digest_los = array('q')
+
+    def add_row(mid_id, name_id, contents_digest):
+        hi, lo = split_digest(contents_digest)
+        row_mid_ids.append(mid_id)
+        row_name_ids.append(name_id)
+        row_digest_his.append(hi)
+        row_digest_los.append(lo)
+
+    with os.scandir(mutants) as it:
+        mids = [entry.name for entry in it if entry.is_dir()]
     num_mutants = len(mids)
+    mid_names = mids + ['0']  # Maps mid_ids back to mutant ids
+    original_mid_id = num_mutants
 
     print("Found {} mids".format(num_mutants))
 
     print("Looking for redundant mutants")
 
-    for i, mid in enumerate(mids):
-        root = os.path.join(mutants, mid)
-
-        # 1c
-        name_tuple = get_name_tuple(root)
-
-        if not name_tuple: continue
-
-        # 1d
-        d = hashes.setdefault(name_tuple, {})
-
-        # 1e
-        contents_tuple = read_name_tuple_from_root(name_tuple, root)
-
-        # 1f
-        eq_class = d.setdefault(contents_tuple, set())
-
-        # 1g
-        eq_class.add(mid)
-
-        if len(eq_class) == 2:
-            nonsingleton_equivalence_classes.append(eq_class)
-        progress(i+1, num_mutants, increment=5)
-
-    progress(num_mutants, num_mutants, newline=True)
-
-    print("Looking for equivalent mutants")
-
-    num_name_tuples = len(hashes)
-    # 2
-    for (i, name_tuple) in enumerate(hashes):
-        # 2a
-        contents_tuple = read_name_tuple_from_root(name_tuple, program)
-        eq_class = hashes[name_tuple].setdefault(contents_tuple, set())
-        eq_class.add('0')
-        if len(eq_class) == 2:
-            nonsingleton_equivalence_classes.append(eq_class)
-        progress(i+1, num_name_tuples, increment=5)
-    progress(num_name_tuples, num_name_tuples, newline=True)
-
-    equivalent_mutants = [x for x in nonsingleton_equivalence_classes if '0' in x]
-    redundant_mutants = [x for x in nonsingleton_equivalence_classes if '0' not in x]
+    output_paths = ('all-equivalences.txt', 'equivalent-mutants.txt', 'redundant-mutants.txt')
+    part_paths = [path + '.part' for path in output_paths]
+
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        checkpoints = progress_checkpoints(num_mutants)
+        scans = bounded_map(executor, scan_mutant,
+                            ((i, (os.path.join(mutants, mid),)) for (i, mid) in enumerate(mids)))
+        for i, (name_tuple, size_tuple) in scans:
+            if i+1 in checkpoints: progress(i+1, num_mutants)
+
+            if not name_tuple: continue
+
+            # 1d
+            name_id = tuple_cache.setdefault(name_tuple, len(tuple_cache))
+            if name_id == len(size_buckets):
+                size_buckets.append({})
+
+            # 1e
+            size_buckets[name_id].setdefault(size_tuple, []).append(i)
+
+        progress(num_mutants, num_mutants, newline=True)
+
+        # 2
+        name_tuples = list(tuple_cache)  # Indexed by name_id
+        num_name_tuples = len(name_tuples)
+        orig_size_cache = {}
+        orig_size_tuples = [tuple(orig_file_size(program, name, orig_size_cache) for name in name_tuple)
+                            for name_tuple in name_tuples]
+        matches_original = set()  # name_ids with some bucket sized like the original
+
+        def needs_hashing(name_id, size_tuple, bucket):
+            # 2a
+            return len(bucket) > 1 or size_tuple == orig_size_tuples[name_id]
+
+        def hash_jobs():
+            # Release each name tuple's buckets as soon as its jobs are issued
+            for name_id in range(num_name_tuples):
+                buckets, size_buckets[name_id] = size_buckets[name_id], None
+                for size_tuple, bucket in buckets.items():
+                    if not needs_hashing(name_id, size_tuple, bucket): continue
+                    if size_tuple == orig_size_tuples[name_id]:
+                        matches_original.add(name_id)
+                    for mid_id in bucket:
+                        yield ((mid_id, name_id), (os.path.join(mutants, mids[mid_id]), name_tuples[name_id]))
+
+        num_to_hash = sum(len(bucket)
+                          for (name_id, buckets) in enumerate(size_buckets)
+                          for (size_tuple, bucket) in buckets.items()
+                          if needs_hashing(name_id, size_tuple, bucket))
+
+        orig_digest_cache = {}  # Each original classfile is hashed at most once
+        orig_digest_his = array('q', bytes(8 * num_name_tuples))
+        orig_digest_los = array('q', bytes(8 * num_name_tuples))
+        orig_hashed = array('B', bytes(num_name_tuples))
+        counts = {'all': [0, 0], 'equivalent': [0, 0], 'redundant': [0, 0]}  # [classes, mutants]
+
+        try:
+            with open(part_paths[0], 'wb') as all_file, \
+                 open(part_paths[1], 'wb') as equivalent_file, \
+                 open(part_paths[2], 'wb') as redundant_file:
+
+                def flush(batch_name_ids):
+                    # 3
+                    for name_id in batch_name_ids:
+                        if name_id not in matches_original: continue
+                        # 3a
+                        contents_digest = read_name_tuple_from_root(name_tuples[name_id], program, orig_digest_cache)
+                        # 3b
+                        orig_digest_his[name_id], orig_digest_los[name_id] = split_digest(contents_digest)
+                        orig_hashed[name_id] = 1
+
+                    # 4: equivalence classes stay lists of integer mid_ids until
+                    # they're written out; the original program is always the
+                    # last member of its class
+                    groups = group_rows((row_mid_ids, row_name_ids, row_digest_his, row_digest_los),
+                                        (orig_hashed, orig_digest_his, orig_digest_los), original_mid_id)
+                    for column in (row_mid_ids, row_name_ids, row_digest_his, row_digest_los):
+                        del column[:]
+
+                    equivalent_mutants = [x for x in groups if x[-1] == original_mid_id]
+                    redundant_mutants = [x for x in groups if x[-1] != original_mid_id]
+
+                    if VALIDATE:
+                        for eq_class in groups:
+                            eq_class = [mid_names[mid_id] for mid_id in eq_class]
+                            name_tuples_seen = (get_name_tuple(os.path.join(mutants, mid)) for mid in eq_class)
+                            if len(set(name_tuples_seen)) != 1:
+                                print("Equiv Class", eq_class, "has name tuples", name_tuples_seen)
+
+                    for (kind, f, eq_classes) in (('all', all_file, groups),
+                                                  ('equivalent', equivalent_file, equivalent_mutants),
+                                                  ('redundant', redundant_file, redundant_mutants)):
+                        write_equivalence_classes(f, eq_classes, mid_names)
+                        counts[kind][0] += len(eq_classes)
+                        counts[kind][1] += sum(len(x) for x in eq_classes)
+
+                print("Hashing {} of {} mutants".format(num_to_hash, num_mutants))
+                checkpoints = progress_checkpoints(num_to_hash)
+                # 2b
+                digests = bounded_map(executor, hash_mutant, hash_jobs())
+                batch_name_ids = []
+                for i, ((mid_id, name_id), contents_digest) in enumerate(digests):
+                    if i+1 in checkpoints: progress(i+1, num_to_hash)
+                    if not batch_name_ids or batch_name_ids[-1] != name_id:
+                        # The previous name tuple is complete
+                        if len(row_mid_ids) >= FLUSH_ROWS:
+                            flush(batch_name_ids)
+                            batch_name_ids = []
+                        batch_name_ids.append(name_id)
+                    # 2c
+                    add_row(mid_id, name_id, contents_digest)
+                flush(batch_name_ids)
+                progress(num_to_hash, num_to_hash, newline=True)
+        except BaseException:
+            for path in part_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+    for part_path, path in zip(part_paths, output_paths):
+        os.replace(part_path, path)
 
     if VALIDATE:
-        print("Validating {} equivalence classes".format(len(nonsingleton_equivalence_classes)))
-        for eq_class in nonsingleton_equivalence_classes:
-            name_tuples = (get_name_tuple(os.path.join(mutants, mid)) for mid in eq_class)
-            if len(set(name_tuples)) != 1:
-                print("Equiv Class", eq_class, "has name tuples", name_tuples)
-
-    with open('all-equivalences.txt', 'w') as f:
-        for eq_class in nonsingleton_equivalence_classes:
-            f.write(' '.join(eq_class))
-            f.write('\n')
-
-    with open('equivalent-mutants.txt', 'w') as f:
-        for eq_class in equivalent_mutants:
-            f.write(' '.join(eq_class))
-            f.write('\n')
-
-    with open('redundant-mutants.txt', 'w') as f:
-        for eq_class in redundant_mutants:
-            f.write(' '.join(eq_class))
-            f.write('\n')
+        print("Validated {} equivalence classes".format(counts['all'][0]))
 
     print("Summary")
     print("-------")
-    num_total_equivalences = sum([len(x) for x in nonsingleton_equivalence_classes]) - len(nonsingleton_equivalence_classes)
-    num_equiv_mutants = sum([len(x) for x in equivalent_mutants]) - len(equivalent_mutants)
-    num_redundant_mutants = sum([len(x) for x in redundant_mutants]) - len(redundant_mutants)
+    num_total_equivalences = counts['all'][1] - counts['all'][0]
+    num_equiv_mutants = counts['equivalent'][1] - counts['equivalent'][0]
+    num_redundant_mutants = counts['redundant'][1] - counts['redundant'][0]
     print("total equivalences:      ", num_total_equivalences)
     print("total equivalent mutants:", num_equiv_mutants)
     print("total redundant mutants: ", num_redundant_mutants)
 
-def progress(done, total, width=80, increment=1, newline=False):
+def write_equivalence_classes(f, eq_classes, mid_names):
+    '''
+    Write each equivalence class of `mid_id`s in `eq_classes` to the binary
+    file `f` as a line of space separated mutant ids, where
+    `mid_names[mid_id]` is the mutant id. The lines are built in memory and
+    written with a single call, bypassing the text layer.
+    '''
+    buf = bytearray()
+    for eq_class in eq_classes:
+        buf += ' '.join([mid_names[mid_id] for mid_id in eq_class]).encode()
+        buf += b'\n'
+    f.write(buf)
+
+def progress(done, total, width=80, newline=False):
     '''A simple progress bar'''
-    if done % increment != 0: return
+    if total == 0: done = total = 1  # Nothing to do counts as finished
     summary = '({} of {} | {:.2f}%)'.format(done, total, 100*done/total)
     summary_width = len(summary)
     bar_width = width - summary_width - 2  # -2 is for the `[` and `]` at the ends of the bar
@@ -209,8 +626,16 @@ def progress(done, total, width=80, increment=1, newline=False):
     spaces_width = bar_width - blocks_width
     bar = "\r[{}{}]{}".format('#' * blocks_width, ' ' * spaces_width, summary)
 
-    print(bar, end='')
-    if newline: print()
+    stdout.write(bar)
+    if newline: stdout.write('\n')
+
+def progress_checkpoints(total):
+    '''
+    Return the set of counts, one per whole percent, at which the progress bar
+    should be redrawn. Checking membership in the hot loop is cheaper than
+    calling `progress` on every iteration.
+    '''
+    return {total * k // 100 for k in range(101)}
 
 if __name__ == "__main__":
 